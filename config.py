@@ -4,14 +4,18 @@
 環境変数から設定を読み込み、デフォルト値を提供する
 """
 
+from __future__ import annotations
+
+import functools
 import os
-from dataclasses import dataclass
-from typing import Optional
-from dotenv import load_dotenv
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set, Tuple
+
+__all__ = ('Config', 'load_config', 'validate_config', 'get_config')
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Config:
-    """WordPress公開設定"""
+    """WordPress公開設定（不変・ハッシュ可能）"""
     server_user: str
     server_host: str
     ssh_port: int
@@ -22,42 +26,207 @@ class Config:
     post_status: str
     site_url: str
     use_highlight_code_block: bool
+    upload_concurrency: int
+    ssh_login_shell: bool
+    # SSH多重化のコントロールソケット（実行ごとに dataclasses.replace で設定する。Noneなら多重化しない）
+    ssh_control_path: Optional[str] = None
+    # 以下は読み込み時に一度だけ組み立てる派生値
+    ssh_args: Tuple[str, ...] = field(init=False)
+    ssh_target: str = field(init=False)
+    
+    def __post_init__(self):
+        ssh_args = ('ssh', '-i', self.ssh_key, '-p', str(self.ssh_port))
+        if self.ssh_control_path:
+            # すべてのsshで1本のマスター接続を共有し、再認証を省く
+            ssh_args += (
+                '-o', 'ControlMaster=auto',
+                '-o', f'ControlPath={self.ssh_control_path}',
+                '-o', 'ControlPersist=60s',
+            )
+        object.__setattr__(self, 'ssh_args', ssh_args)
+        object.__setattr__(self, 'ssh_target', f"{self.server_user}@{self.server_host}")
 
-def load_config(config_file: Optional[str] = None) -> Config:
+# 必須環境変数
+_REQUIRED_VARS = ('WP_SERVER_USER', 'WP_SERVER_HOST', 'WP_SSH_KEY', 'WP_PATH')
+
+# 有効な投稿ステータス
+_VALID_STATUS_NAMES = ('draft', 'publish', 'private', 'pending')
+_VALID_STATUSES = frozenset(_VALID_STATUS_NAMES)
+
+# エラーメッセージ（可変部分のみ連結して使う）
+_ERR_MISSING = "必須環境変数が設定されていません: "
+_ERR_SSH_PORT_INT = "WP_SSH_PORT は整数で指定してください: "
+_ERR_UPLOAD_CONCURRENCY = "WP_UPLOAD_CONCURRENCY は1以上の整数で指定してください: "
+_ERR_SSH_KEY = "SSH鍵ファイルが見つかりません: "
+_ERR_SSH_PORT = "無効なSSHポート番号: "
+_ERR_POST_STATUS = "無効な投稿ステータス: "
+_ERR_POST_STATUS_HINT = ". 有効な値: " + ', '.join(_VALID_STATUS_NAMES)
+
+# 真と解釈するフラグ値（小文字）
+_TRUTHY = frozenset(('true', '1', 'yes', 'on', 't'))
+
+# 検証済み設定のキャッシュ（キー: (設定ファイル, 更新時刻)）
+_CONFIG_CACHE: Dict[Tuple[Optional[str], int], Config] = {}
+
+# 読み込み済みの .env（キー: (設定ファイル, 更新時刻)）
+_DOTENV_LOADED: Set[Tuple[Optional[str], int]] = set()
+
+# load_dotenv(None) が最初に探す .env（このモジュールと同じディレクトリ）
+_DEFAULT_ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+
+def _config_cache_key(config_file: Optional[str]) -> Tuple[Optional[str], int]:
+    """設定ファイルの更新時刻を含むキャッシュキーを生成"""
+    try:
+        return (config_file, os.stat(config_file or _DEFAULT_ENV_FILE).st_mtime_ns)
+    except FileNotFoundError:
+        return (None, 0)
+
+def _dir_mtime(path: str) -> int:
+    """パスの親ディレクトリの更新時刻を取得（存在しない場合は0）"""
+    try:
+        return os.stat(os.path.dirname(path) or '.').st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+@functools.lru_cache(maxsize=32)
+def _ssh_key_exists(path: str, sentinel: int) -> bool:
+    """SSH鍵の存在確認（親ディレクトリが変わらない限り結果を再利用）"""
+    return os.path.exists(path)
+
+def _fast_dotenv(path: str) -> bool:
     """
-    設定を環境変数から読み込み
+    単純な KEY=VALUE 形式の.envを読み込み、未設定の環境変数のみ設定する
     
     Args:
-        config_file: .envファイルのパス（指定しない場合は標準の.envを使用）
+        path: .envファイルのパス
         
     Returns:
-        Config: 設定オブジェクト
-        
-    Raises:
-        ValueError: 必須環境変数が未設定の場合
+        bool: 読み込めた場合はTrue、対応外の書式を含む場合はFalse（何も設定しない）
     """
-    load_dotenv(config_file)
+    values = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            key, sep, value = line.partition('=')
+            key = key.strip()
+            value = value.strip()
+            # export・変数展開・エスケープ・インラインコメントはpython-dotenvに任せる
+            if not sep or not key or ' ' in key or '$' in value or '\\' in value:
+                return False
+            if value[:1] in ('"', "'"):
+                if len(value) < 2 or value[-1] != value[0]:
+                    return False
+                value = value[1:-1]
+            elif '#' in value:
+                return False
+            values[key] = value
     
+    for key, value in values.items():
+        os.environ.setdefault(key, value)
+    return True
+
+def _read_env(config_file: Optional[str]) -> Dict[str, str]:
+    """.envを読み込み、環境変数のスナップショットを返す"""
+    # 同じ .env を読み込み済みなら再パースしない
+    dotenv_key = _config_cache_key(config_file)
+    if dotenv_key not in _DOTENV_LOADED:
+        env_file = config_file or _DEFAULT_ENV_FILE
+        if not (os.path.isfile(env_file) and _fast_dotenv(env_file)):
+            # 複雑な書式や.envの探索が必要な場合のみpython-dotenvを使う
+            from dotenv import load_dotenv
+            load_dotenv(config_file)
+        _DOTENV_LOADED.add(dotenv_key)
+    
+    # 環境変数を一度だけスナップショットし、以降は辞書から参照する
+    return dict(os.environ)
+
+def _check_fields(ssh_key: str, ssh_port: int, post_status: str) -> None:
+    """SSH鍵・ポート番号・投稿ステータスを検証"""
+    if not _ssh_key_exists(ssh_key, _dir_mtime(ssh_key)):
+        raise ValueError(_ERR_SSH_KEY + ssh_key)
+        
+    if not 1 <= ssh_port <= 65535:
+        raise ValueError(_ERR_SSH_PORT + str(ssh_port))
+        
+    if post_status not in _VALID_STATUSES:
+        raise ValueError(_ERR_POST_STATUS + post_status + _ERR_POST_STATUS_HINT)
+
+def _build_validated_config(env: Dict[str, str]) -> Config:
+    """環境変数を検証し、検証済みの設定オブジェクトを生成"""
     # 必須環境変数のチェック
-    required_vars = ['WP_SERVER_USER', 'WP_SERVER_HOST', 'WP_SSH_KEY', 'WP_PATH']
-    missing_vars = [var for var in required_vars if not os.getenv(var)]
+    missing_vars = [var for var in _REQUIRED_VARS if not env.get(var)]
     
     if missing_vars:
-        raise ValueError(f"必須環境変数が設定されていません: {', '.join(missing_vars)}")
+        raise ValueError(_ERR_MISSING + ', '.join(missing_vars))
+    
+    ssh_port_raw = env.get('WP_SSH_PORT', '22')
+    try:
+        ssh_port = int(ssh_port_raw)
+    except ValueError:
+        raise ValueError(_ERR_SSH_PORT_INT + ssh_port_raw) from None
+    
+    upload_concurrency_raw = env.get('WP_UPLOAD_CONCURRENCY', '4')
+    try:
+        upload_concurrency = int(upload_concurrency_raw)
+    except ValueError:
+        upload_concurrency = 0
+    if upload_concurrency < 1:
+        raise ValueError(_ERR_UPLOAD_CONCURRENCY + upload_concurrency_raw)
+    
+    # SSH鍵はローカルのパスなので、ここで一度だけ ~ を展開する
+    # （wp_cli / tmp_dir はリモートで解釈されるため展開しない）
+    ssh_key = os.path.expanduser(env['WP_SSH_KEY'])
+    post_status = env.get('WP_POST_STATUS', 'draft')
+    _check_fields(ssh_key, ssh_port, post_status)
+    
+    # 小文字の値（既定値・.env.example の書式）は変換せずに判定する
+    use_highlight_raw = env.get('WP_USE_HIGHLIGHT_CODE_BLOCK', 'true')
+    use_highlight = use_highlight_raw in _TRUTHY or use_highlight_raw.casefold() in _TRUTHY
+    ssh_login_shell_raw = env.get('WP_SSH_LOGIN_SHELL', 'true')
+    ssh_login_shell = ssh_login_shell_raw in _TRUTHY or ssh_login_shell_raw.casefold() in _TRUTHY
     
     return Config(
-        server_user=os.getenv('WP_SERVER_USER'),
-        server_host=os.getenv('WP_SERVER_HOST'), 
-        ssh_port=int(os.getenv('WP_SSH_PORT', '22')),
-        ssh_key=os.getenv('WP_SSH_KEY'),
-        wp_path=os.getenv('WP_PATH'),
-        wp_cli=os.getenv('WP_CLI', '~/bin/wp/wp-cli.phar'),
-        tmp_dir=os.getenv('WP_TMP_DIR', 'tmp'),
-        post_status=os.getenv('WP_POST_STATUS', 'draft'),
-        site_url=os.getenv('WP_SITE_URL'),
-        use_highlight_code_block=os.getenv('WP_USE_HIGHLIGHT_CODE_BLOCK', 'True').lower() == 'true'
+        server_user=env['WP_SERVER_USER'],
+        server_host=env['WP_SERVER_HOST'], 
+        ssh_port=ssh_port,
+        ssh_key=ssh_key,
+        wp_path=env['WP_PATH'],
+        wp_cli=env.get('WP_CLI', '~/bin/wp/wp-cli.phar'),
+        tmp_dir=env.get('WP_TMP_DIR', 'tmp'),
+        post_status=post_status,
+        site_url=env.get('WP_SITE_URL'),
+        use_highlight_code_block=use_highlight,
+        upload_concurrency=upload_concurrency,
+        ssh_login_shell=ssh_login_shell
     )
 
+def load_config(config_file: Optional[str] = None) -> Config:
+    """
+    設定を環境変数から読み込み、検証する
+    
+    .envファイルが更新されていなければ、前回検証済みの設定を再利用する
+    
+    Args:
+        config_file: .envファイルのパス（指定しない場合は標準の.envを使用）
+        
+    Returns:
+        Config: 検証済み設定オブジェクト
+        
+    Raises:
+        ValueError: 必須環境変数が未設定、または設定が無効な場合
+    """
+    key = _config_cache_key(config_file)
+    cached = _CONFIG_CACHE.get(key)
+    if cached is not None:
+        return cached
+    
+    config = _build_validated_config(_read_env(config_file))
+    # 検証に成功した設定のみキャッシュする
+    _CONFIG_CACHE[key] = config
+    return config
+
 def validate_config(config: Config) -> None:
     """
     設定の妥当性をチェック
@@ -68,15 +237,7 @@ def validate_config(config: Config) -> None:
     Raises:
         ValueError: 設定が無効な場合
     """
-    if not os.path.exists(config.ssh_key):
-        raise ValueError(f"SSH鍵ファイルが見つかりません: {config.ssh_key}")
-        
-    if config.ssh_port < 1 or config.ssh_port > 65535:
-        raise ValueError(f"無効なSSHポート番号: {config.ssh_port}")
-        
-    valid_statuses = ['draft', 'publish', 'private', 'pending']
-    if config.post_status not in valid_statuses:
-        raise ValueError(f"無効な投稿ステータス: {config.post_status}. 有効な値: {valid_statuses}")
+    _check_fields(config.ssh_key, config.ssh_port, config.post_status)
 
 def get_config() -> Config:
     """
@@ -85,6 +246,4 @@ def get_config() -> Config:
     Returns:
         Config: 検証済み設定オブジェクト
     """
-    config = load_config()
-    validate_config(config)
-    return config
+    return load_config()
@@ -5,105 +5,286 @@ Markdownファイルを画像付きでWordPressに投稿するメインスクリ
 内部リンク変換機能付き + 脚注対応
 """
 
-import subprocess, sys, yaml, os, re, shutil, hashlib, json, uuid
+import subprocess, sys, yaml, os, re, shutil, shlex, hashlib, json, uuid, tempfile, functools, logging, contextlib, dataclasses
 from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple
 from config import get_config
 
+# フロントマターの読み込みには libyaml（C実装）を使う（未対応のPyYAMLでは純Python版）
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+# 書き出しは純Python版を使う（CSafeDumper は allow_unicode=True でも絵文字などBMP外の文字を
+# "\U0001F389" のようにエスケープし、ユーザーのノートを書き換えてしまうため）
+from yaml import SafeDumper as _YamlDumper
+
+# 進捗はINFO、画像パスの探索など項目ごとの詳細はDEBUGで出力する
+logger = logging.getLogger(__name__)
+
+# 正規表現（呼び出しごとのコンパイルを避けるため、読み込み時に一度だけコンパイル）
+_RE_SHORTCODE = re.compile(r'\[[\w\-_]+[^\]]*\]')
+# インライン記法（コード・太字斜体・太字・斜体・脚注参照・リンク）を1回の走査で処理する
+# 斜体の中身には完結した太字を含められる（例: *a **b** c*）
+# 閉じ側が非対称な入れ子（***x** y* / **x *y*** / ***x* y**）と太字斜体（***x*** / ___x___）は
+# 太字より先に判定する（非対称な形を先に見ることで、太字斜体が後ろの *** まで読み進めないようにする）
+_RE_INLINE = re.compile(
+    r'`(?P<code>[^`]+)`'
+    r'|\*(?P<i3>\*\*[^*]+?\*\*[^*]+)\*'
+    r'|_(?P<i4>__[^_]+?__[^_]+)_'
+    r'|\*\*(?P<b3>[^*]*\*[^*]+?\*)\*\*'
+    r'|__(?P<b4>[^_]*_[^_]+?_)__'
+    r'|\*\*(?P<b5>\*[^*]+?\*[^*]*)\*\*'
+    r'|__(?P<b6>_[^_]+?_[^_]*)__'
+    r'|\*\*\*(?P<bi1>.+?)\*\*\*'
+    r'|___(?P<bi2>.+?)___'
+    r'|\*\*(?P<b1>.*?)\*\*'
+    r'|__(?P<b2>.*?)__'
+    r'|\*(?P<i1>(?:\*\*.*?\*\*|[^*])*)\*'
+    r'|_(?P<i2>(?:__.*?__|[^_])*)_'
+    r'|\[\^(?P<fn>[^\]]+)\]'
+    r'|\[(?P<ltext>[^\]^]+)\]\((?P<lurl>[^\)]+)\)'
+)
+_RE_FOOTNOTE_REF = re.compile(r'\[\^([^\]]+)\]')
+_RE_FOOTNOTE_DEF = re.compile(r'^\[\^([^\]]+)\]:\s*(.+)$')
+_RE_MD_LINK = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+_RE_URL = re.compile(r'(https?://[^\s]+)')
+_RE_UNSAFE_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*]')
+_RE_HYPHENS = re.compile(r'-+')
+_RE_IMG = re.compile(r'!\[([^\]]*)\]\(([^)]*)\)')
+# 行の種類（見出し・コードブロック・テーブル・引用・リスト・画像）を1回のマッチで判定する
+_RE_LINE_KIND = re.compile(
+    r'(?P<heading>#{1,6})(?!#)'
+    r'|(?P<fence>```)'
+    r'|(?P<table>\|(?:.*\|)?$)'
+    r'|(?P<quote>>)'
+    r'|(?P<list>[-*+]\s|\d+\.\s)'
+    r'|(?P<image>!\[.*\]\(.*\))'
+)
+# 上記のいずれかで始まりうる先頭文字（数字は str.isdecimal で判定する）
+_LINE_KIND_FIRST_CHARS = frozenset('#`|>-*+!')
+_RE_LIST_ORD_START = re.compile(r'^\d+\.')
+_RE_LIST_UNORD_ITEM = re.compile(r'^[-*+]\s*(.*)')
+_RE_LIST_ORD_ITEM = re.compile(r'^\d+\.\s*(.*)')
+_RE_LIST_CONTINUE = re.compile(r'^[-*+\d]')
+_RE_CODE_FENCE = re.compile(r'^```(\w*)')
+
 def ssh_cmd(config, cmd):
-    """SSH コマンドを構築"""
-    return ["ssh", "-i", config.ssh_key, "-p", str(config.ssh_port),
-            f"{config.server_user}@{config.server_host}", f"bash -l -c '{cmd}'"]
+    """
+    SSH コマンドを構築
+    
+    cmd は既定ではリモートのログインシェル（wp-cli の PATH を通すため）で実行する。
+    WP_SSH_LOGIN_SHELL=false の場合はプロファイルを読み込まず、sh -c で実行する
+    （WP_CLI は絶対パスで指定すること）。
+    cmd は POSIX sh の構文（$(...)・{ ...; }・|| など）で組み立てるため、どちらの場合も
+    ユーザーのログインシェル（fish・csh など）には直接解釈させない。
+    cmd 内に埋め込む投稿データ（タイトル・ファイル名など）は呼び出し側で shlex.quote すること
+    """
+    if config.ssh_login_shell:
+        cmd = f"bash -l -c {shlex.quote(cmd)}"
+    else:
+        cmd = f"sh -c {shlex.quote(cmd)}"
+    return [*config.ssh_args, config.ssh_target, cmd]
 
-def scp_cmd(config, local_path, remote_name):
-    """SCP コマンドを構築"""
-    remote_tmp_dir = f"{config.wp_path}/{config.tmp_dir}"
-    subprocess.run(ssh_cmd(config, f"mkdir -p {remote_tmp_dir}"), check=True)
-    remote_tmp_path = f"{remote_tmp_dir}/{remote_name}"
-    return ["scp", "-i", config.ssh_key, "-P", str(config.ssh_port), local_path,
-            f"{config.server_user}@{config.server_host}:{remote_tmp_path}"]
+def open_ssh_master(config):
+    """
+    SSHマスター接続を確立
+    
+    config.ssh_control_path は実行ごとの専用ディレクトリに置くため、
+    他の実行のマスター接続を流用・終了することはない
+    """
+    subprocess.run([*config.ssh_args, "-M", "-N", "-f", config.ssh_target], check=True)
 
-def parse_frontmatter(md_file):
-    """Markdownファイルのフロントマターを解析"""
+def close_ssh_master(config):
+    """この実行で確立したSSHマスター接続を終了"""
+    subprocess.run([*config.ssh_args, "-O", "exit", config.ssh_target],
+                   capture_output=True)
+
+def _split_frontmatter(text):
+    """
+    先頭のフロントマターの範囲を求める（正規表現を使わず str.find で区切りを探す）
+    
+    "---\n" に続く最初の "\n---" までをフロントマターとする
+    
+    Returns:
+        (フロントマターのYAML文字列（無い場合はNone）, 閉じ区切りの直後の位置（無い場合は0）)
+    """
+    if not text.startswith("---\n"):
+        return None, 0
+    end = text.find("\n---", 4)
+    if end == -1:
+        return None, 0
+    return text[4:end], end + 4
+
+def _strip_frontmatter(text):
+    """先頭の "---" から最初の "---\n" までを取り除いた本文を返す（フロントマターが無い場合はそのまま）"""
+    if not text.startswith("---"):
+        return text
+    end = text.find("---\n", 3)
+    return text[end + 4:] if end != -1 else text
+
+def load_md(md_file):
+    """Markdownファイルを1回だけ読み込み、本文全体とフロントマターを返す"""
     with open(md_file, encoding="utf-8") as f:
         text = f.read()
-    m = re.match(r"---\n(.*?)\n---", text, re.S)
-    return yaml.safe_load(m.group(1)) if m else {}
+    fm_text, _ = _split_frontmatter(text)
+    return text, (yaml.load(fm_text, Loader=_YamlLoader) if fm_text is not None else {})
 
-def write_frontmatter(md_file, fm):
-    """フロントマターをMarkdownファイルに書き込み"""
+# フロントマター読み込み時の1回あたりの読み込みサイズ（文字数）
+_FRONTMATTER_CHUNK_SIZE = 4096
+
+def _read_frontmatter_block(f):
+    """
+    ファイル先頭のフロントマター部分だけを読み込む（本文は読まない）
+    
+    Returns:
+        フロントマターのYAML文字列（無い場合はNone）
+    """
+    buf = f.read(_FRONTMATTER_CHUNK_SIZE)
+    if not buf.startswith("---\n"):
+        return None
+
+    # "---\n" に続く最初の "\n---" までがフロントマター（_split_frontmatter と同じ範囲）
+    start = 4
+    while (end := buf.find("\n---", start)) == -1:
+        chunk = f.read(_FRONTMATTER_CHUNK_SIZE)
+        if not chunk:
+            return None
+        # 区切りがチャンクの境界をまたぐ場合に備えて少し手前から探す
+        start = max(4, len(buf) - 3)
+        buf += chunk
+    return buf[4:end]
+
+def parse_frontmatter(md_file):
+    """Markdownファイルのフロントマターを解析（先頭のフロントマター部分だけを読み込む）"""
     with open(md_file, encoding="utf-8") as f:
-        text = f.read()
-    new_fm = yaml.dump(fm, allow_unicode=True, sort_keys=False)
-    if text.startswith("---"):
-        new_text = re.sub(r"---\n.*?\n---", f"---\n{new_fm}---", text, flags=re.S)
+        fm_text = _read_frontmatter_block(f)
+    return yaml.load(fm_text, Loader=_YamlLoader) if fm_text is not None else {}
+
+@contextlib.contextmanager
+def _atomic_writer(path):
+    """
+    同じディレクトリの一時ファイルに書き込み、成功した場合のみ os.replace で置き換える
+    
+    シンボリックリンクの場合はリンク先の実ファイルを置き換える（リンク自体は残す）
+    """
+    path = os.path.realpath(path)
+    tmp = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(path), delete=False)
+    try:
+        with tmp:
+            yield tmp
+        shutil.copymode(path, tmp.name)
+        os.replace(tmp.name, path)
+    except BaseException:
+        # 書き込み・権限コピー・置き換えのいずれかに失敗した場合は一時ファイルを残さない
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp.name)
+        raise
+
+def write_frontmatter(md_file, fm, text, original=None):
+    """
+    フロントマターをMarkdownファイルに書き込み（一時ファイル経由で置き換える）
+    
+    ファイルは読み直さず、text のフロントマターを置き換えて書き込む
+    書き込む内容がファイルの現在の内容と同じ場合は書き込まない
+    
+    Args:
+        original: ファイルの現在の内容（text が本文を書き換えたものの場合に指定。省略時は text）
+    
+    Returns:
+        str: 書き込んだファイル全体の内容
+    """
+    new_fm = yaml.dump(fm, Dumper=_YamlDumper, allow_unicode=True, sort_keys=False)
+    fm_text, end = _split_frontmatter(text)
+    if fm_text is not None:
+        new_text = f"---\n{new_fm}---{text[end:]}"
+    elif text.startswith("---"):
+        # 閉じ区切りのない不正なフロントマターは変更しない
+        return text
     else:
         new_text = f"---\n{new_fm}---\n\n{text}"
-    with open(md_file, "w", encoding="utf-8") as f:
+    # フロントマターだけでなくファイル全体で比較する（本文だけの変更も書き込む）
+    if new_text == (text if original is None else original):
+        return new_text
+    with _atomic_writer(md_file) as f:
         f.write(new_text)
+    return new_text
+
+# ファイルハッシュのキャッシュ（キー: (絶対パス, 更新時刻, サイズ)）
+_hash_cache: Dict[Tuple[str, int, int], str] = {}
 
 def get_file_hash(file_path):
-    """ファイルのハッシュ値を取得"""
+    """ファイルのハッシュ値を取得（内容が変わらない限り再計算しない）"""
+    st = os.stat(file_path)
+    key = (os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
+    cached = _hash_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    # 既存の wp_images のキーと互換を保つため MD5 のまま、全体を読み込まずに計算する
     with open(file_path, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()[:8]  # 短縮版
+        if hasattr(hashlib, 'file_digest'):
+            # Python 3.11以降: 固定バッファに読み込み、GILを解放して計算する
+            h = hashlib.file_digest(f, lambda: hashlib.md5(usedforsecurity=False))
+        else:
+            h = hashlib.md5(usedforsecurity=False)
+            while chunk := f.read(1 << 16):
+                h.update(chunk)
+    file_hash = _hash_cache[key] = h.hexdigest()[:8]  # 短縮版
+    return file_hash
 
 def upload_new_image(config, image_path, slug, file_hash):
     """ハッシュベースの名前でアップロード"""
     ext = os.path.splitext(image_path)[1]
     wp_filename = f"{slug}-{file_hash}{ext}"
+    remote_tmp_dir = f"{config.wp_path}/{config.tmp_dir}"
+    remote_file = shlex.quote(wp_filename)
 
-    print(f"   アップロード開始: {wp_filename}")
-    print(f"   元ファイル: {image_path}")
-
-    # サーバにアップロード
-    try:
-        subprocess.run(scp_cmd(config, image_path, wp_filename), check=True)
-        print(f"   ✅ SCP完了")
-    except subprocess.CalledProcessError as e:
-        print(f"   ❌ SCP失敗: {e}")
-        raise
+    logger.info("   アップロード開始: %s", wp_filename)
+    logger.debug("   元ファイル: %s", image_path)
 
-    # WordPressにインポート
-    import_cmd = f"cd {config.wp_path}/{config.tmp_dir} && {config.wp_cli} media import {wp_filename} --porcelain && rm {wp_filename}"
-    print(f"   WP-CLI実行: {import_cmd}")
+    # 転送（標準入力経由）・WordPressへのインポート・URL取得を1回のSSHで実行
+    upload_cmd = (
+        f"mkdir -p {remote_tmp_dir} && cd {remote_tmp_dir} && cat > {remote_file} && "
+        f"media_id=$({config.wp_cli} media import {remote_file} --porcelain) && rm {remote_file} && "
+        f"echo $media_id && cd {config.wp_path} && {config.wp_cli} post get $media_id --field=guid"
+    )
+    logger.debug("   WP-CLI実行: %s", upload_cmd)
 
     try:
-        media_id = subprocess.check_output(
-            ssh_cmd(config, import_cmd),
-            text=True
-        ).strip()
-        print(f"   ✅ WordPress インポート完了: ID {media_id}")
-    except subprocess.CalledProcessError as e:
-        print(f"   ❌ WordPress インポート失敗: {e}")
-        # エラー詳細を取得
-        try:
-            error_output = subprocess.check_output(
-                ssh_cmd(config, f"cd {config.wp_path}/{config.tmp_dir} && {config.wp_cli} media import {wp_filename} && rm {wp_filename}"),
+        with open(image_path, 'rb') as f:
+            result = subprocess.run(
+                ssh_cmd(config, upload_cmd),
+                stdin=f,
+                capture_output=True,
                 text=True,
-                stderr=subprocess.STDOUT
+                check=True
             )
-            print(f"   エラー詳細: {error_output}")
-        except:
-            pass
-        raise
-
-    # URLを取得
-    try:
-        wp_url = subprocess.check_output(
-            ssh_cmd(config, f"cd {config.wp_path} && {config.wp_cli} post get {media_id} --field=guid"),
-            text=True
-        ).strip()
-        print(f"   ✅ URL取得完了: {wp_url}")
     except subprocess.CalledProcessError as e:
-        print(f"   ❌ URL取得失敗: {e}")
+        logger.error("   ❌ アップロード失敗: %s: %s", wp_filename, e)
+        if e.stderr:
+            logger.error("   エラー詳細(%s): %s", wp_filename, e.stderr.strip())
         raise
 
+    # 1行目: メディアID、最終行: URL
+    output_lines = result.stdout.split()
+    media_id, wp_url = output_lines[0], output_lines[-1]
+    # 並列アップロード時に行が混ざっても対応が分かるよう、ファイル名を含めて1行で出力
+    logger.info("   ✅ WordPress インポート完了: %s -> ID %s, URL %s", wp_filename, media_id, wp_url)
+
     return media_id, wp_url
 
+# resolve_*_path の vault_root 省略時の目印（None は「Vaultなし」を表すため別に用意）
+_VAULT_ROOT_UNSET = object()
+
 def find_obsidian_vault_root(md_file):
     """ObsidianのVault root ディレクトリを探す(.obsidianフォルダを探す)"""
-    current_dir = os.path.dirname(os.path.abspath(md_file))
+    return _find_vault_root_from_dir(os.path.dirname(os.path.abspath(md_file)))
 
+@functools.lru_cache(maxsize=32)
+def _find_vault_root_from_dir(current_dir):
+    """ディレクトリから上方向に.obsidianフォルダを探す（同じディレクトリの結果は再利用）"""
     while current_dir != os.path.dirname(current_dir):  # ルートディレクトリまで
         obsidian_dir = os.path.join(current_dir, '.obsidian')
         if os.path.exists(obsidian_dir):
@@ -112,60 +293,80 @@ def find_obsidian_vault_root(md_file):
 
     return None
 
-def resolve_image_path(md_file, img_path):
+def _find_existing_path(md_dir, vault_root, paths_to_try):
     """
-    Obsidianの画像パスを解決する
-    - 保管庫内絶対パス (images/sample.jpg)
-    - ファイル相対パス (./images/sample.jpg)
-    - URLエンコーディングされたパス (Pasted%20image%2020240210150905.png)
-    両方に対応
+    候補パスを順に試し、最初に見つかったファイルの絶対パスを返す
+    
+    各パスについて 相対パス(./ ../) -> Vault絶対パス -> 通常の相対パス の順に試す。
+    同じ絶対パスは1回だけ確認する
     """
-    if img_path.startswith('http'):
-        return None  # URLはスキップ
-
-    # URLデコードを実行
-    decoded_img_path = unquote(img_path)
-    print(f"   画像パス解決: '{img_path}' -> '{decoded_img_path}'")
-
-    md_dir = os.path.dirname(os.path.abspath(md_file))
-
-    # 元のパスとデコード後のパス両方で試行
-    paths_to_try = [img_path, decoded_img_path]
+    tried = set()
+
+    def check(abs_path, label):
+        if abs_path in tried:
+            return False
+        tried.add(abs_path)
+        logger.debug("     %s試行: %s", label, abs_path)
+        if os.path.isfile(abs_path):
+            logger.debug("     ✅ 発見(%s): %s", label, abs_path)
+            return True
+        return False
 
     for current_path in paths_to_try:
-        print(f"   試行パス: {current_path}")
+        logger.debug("   試行パス: %s", current_path)
 
-        # 相対パス (./や../で始まる) の場合
+        # ファイルからの相対パス（./や../で始まる場合は最優先、それ以外は後方互換性のため最後に試す）
+        relative_path = os.path.normpath(os.path.join(md_dir, current_path))
         if current_path.startswith('./') or current_path.startswith('../'):
-            abs_path = os.path.normpath(os.path.join(md_dir, current_path))
-            print(f"     相対パス試行: {abs_path}")
-            if os.path.exists(abs_path):
-                print(f"     ✅ 発見(相対): {abs_path}")
-                return abs_path
+            if check(relative_path, "相対パス"):
+                return relative_path
 
         # 保管庫内絶対パス (images/sample.jpgなど) の場合
-        vault_root = find_obsidian_vault_root(md_file)
         if vault_root:
             vault_abs_path = os.path.normpath(os.path.join(vault_root, current_path))
-            print(f"     Vault絶対パス試行: {vault_abs_path}")
-            if os.path.exists(vault_abs_path):
-                print(f"     ✅ 発見(Vault): {vault_abs_path}")
+            if check(vault_abs_path, "Vault絶対パス"):
                 return vault_abs_path
 
         # 通常の相対パスとして試行（後方互換性）
-        normal_relative = os.path.normpath(os.path.join(md_dir, current_path))
-        print(f"     通常相対パス試行: {normal_relative}")
-        if os.path.exists(normal_relative):
-            print(f"     ✅ 発見(通常): {normal_relative}")
-            return normal_relative
+        if check(relative_path, "通常相対パス"):
+            return relative_path
 
-    print(f"   ❌ 全ての試行で画像が見つかりませんでした")
     return None
 
-def resolve_markdown_link_path(md_file, link_path):
+def resolve_image_path(md_file, img_path, vault_root=_VAULT_ROOT_UNSET, md_dir=None):
+    """
+    Obsidianの画像パスを解決する
+    - 保管庫内絶対パス (images/sample.jpg)
+    - ファイル相対パス (./images/sample.jpg)
+    - URLエンコーディングされたパス (Pasted%20image%2020240210150905.png)
+    両方に対応
+    
+    vault_root・md_dir（Markdownファイルの絶対ディレクトリ）を渡した場合は再計算を省略する
+    """
+    if img_path.startswith('http'):
+        return None  # URLはスキップ
+
+    # URLデコードを実行
+    decoded_img_path = unquote(img_path)
+    logger.debug("   画像パス解決: '%s' -> '%s'", img_path, decoded_img_path)
+
+    if md_dir is None:
+        md_dir = os.path.dirname(os.path.abspath(md_file))
+    if vault_root is _VAULT_ROOT_UNSET:
+        vault_root = find_obsidian_vault_root(md_file)
+
+    # 元のパスとデコード後のパス両方で試行
+    abs_path = _find_existing_path(md_dir, vault_root, (img_path, decoded_img_path))
+    if abs_path is None:
+        logger.error("   ❌ 全ての試行で画像が見つかりませんでした")
+    return abs_path
+
+def resolve_markdown_link_path(md_file, link_path, vault_root=_VAULT_ROOT_UNSET, md_dir=None):
     """
     Obsidianのマークダウンリンクパスを解決する
     画像と同じロジックを使用（.md拡張子付き）
+    
+    vault_root・md_dir（Markdownファイルの絶対ディレクトリ）を渡した場合は再計算を省略する
     """
     if link_path.startswith('http'):
         return None  # URLはスキップ
@@ -177,59 +378,37 @@ def resolve_markdown_link_path(md_file, link_path):
     if not decoded_link_path.endswith('.md'):
         decoded_link_path += '.md'
 
-    print(f"   リンクパス解決: '{link_path}' -> '{decoded_link_path}'")
-
-    md_dir = os.path.dirname(os.path.abspath(md_file))
+    logger.debug("   リンクパス解決: '%s' -> '%s'", link_path, decoded_link_path)
 
-    # 元のパスとデコード後のパス両方で試行
-    paths_to_try = [link_path, decoded_link_path]
-
-    for current_path in paths_to_try:
-        # .md拡張子がなければ追加
-        if not current_path.endswith('.md'):
-            current_path += '.md'
-
-        print(f"   試行パス: {current_path}")
-
-        # 相対パス (./や../で始まる) の場合
-        if current_path.startswith('./') or current_path.startswith('../'):
-            abs_path = os.path.normpath(os.path.join(md_dir, current_path))
-            print(f"     相対パス試行: {abs_path}")
-            if os.path.exists(abs_path):
-                print(f"     ✅ 発見(相対): {abs_path}")
-                return abs_path
-
-        # 保管庫内絶対パス
+    if md_dir is None:
+        md_dir = os.path.dirname(os.path.abspath(md_file))
+    if vault_root is _VAULT_ROOT_UNSET:
         vault_root = find_obsidian_vault_root(md_file)
-        if vault_root:
-            vault_abs_path = os.path.normpath(os.path.join(vault_root, current_path))
-            print(f"     Vault絶対パス試行: {vault_abs_path}")
-            if os.path.exists(vault_abs_path):
-                print(f"     ✅ 発見(Vault): {vault_abs_path}")
-                return vault_abs_path
 
-        # 通常の相対パスとして試行（後方互換性）
-        normal_relative = os.path.normpath(os.path.join(md_dir, current_path))
-        print(f"     通常相対パス試行: {normal_relative}")
-        if os.path.exists(normal_relative):
-            print(f"     ✅ 発見(通常): {normal_relative}")
-            return normal_relative
+    # 元のパスとデコード後のパス両方で試行（.md拡張子がなければ追加）
+    paths_to_try = [path if path.endswith('.md') else path + '.md' for path in (link_path, decoded_link_path)]
+    abs_path = _find_existing_path(md_dir, vault_root, paths_to_try)
+    if abs_path is None:
+        logger.error("   ❌ 全ての試行でリンク先ファイルが見つかりませんでした")
+    return abs_path
 
-    print(f"   ❌ 全ての試行でリンク先ファイルが見つかりませんでした")
-    return None
+@functools.lru_cache(maxsize=512)
+def _cached_frontmatter(md_file_path, mtime_ns):
+    """リンク先のフロントマターを解析（ファイルが更新されていなければ結果を再利用、読み取り専用）"""
+    return parse_frontmatter(md_file_path)
 
 def get_wordpress_link_data_from_md(config, md_file_path):
     """
     Markdownファイルからwp_id、slug、titleを読み取り、リンクデータを生成
     """
     try:
-        fm = parse_frontmatter(md_file_path)
+        fm = _cached_frontmatter(os.path.abspath(md_file_path), os.stat(md_file_path).st_mtime_ns)
         wp_id = fm.get('wp_id')
         slug = fm.get('slug')
         title = fm.get('title', os.path.splitext(os.path.basename(md_file_path))[0])
 
         if not wp_id:
-            print(f"   ⚠️ リンク先ファイルにwp_idが設定されていません: {md_file_path}")
+            logger.warning("   ⚠️ リンク先ファイルにwp_idが設定されていません: %s", md_file_path)
             return None
 
         # WordPress URLを生成（設定のsite_urlを使用）
@@ -243,11 +422,11 @@ def get_wordpress_link_data_from_md(config, md_file_path):
             'url': wp_url
         }
 
-        print(f"   ✅ リンクデータ生成: ID={wp_id}, タイトル={title}")
+        logger.info("   ✅ リンクデータ生成: ID=%s, タイトル=%s", wp_id, title)
         return link_data
 
     except Exception as e:
-        print(f"   ❌ リンク先ファイルの読み込みエラー: {e}")
+        logger.error("   ❌ リンク先ファイルの読み込みエラー: %s", e)
         return None
 
 def process_internal_links(config, md_file, text):
@@ -255,18 +434,17 @@ def process_internal_links(config, md_file, text):
     Markdown内のローカルリンクをWordPress内部リンクブロック（Gutenberg）に変換
     [リンクテキスト](ファイル名.md) → <!-- wp:loos/post-link ... /-->
     """
-    print("内部リンク変換処理開始...")
-
-    # Markdownリンクパターン [text](link)
-    link_pattern = r'\[([^\]]+)\]\(([^)]+)\)'
-
-    # 変換されたリンクを保存（後でまとめて置換）
-    links_to_replace = []
+    logger.info("内部リンク変換処理開始...")
 
-    def analyze_link(match):
-        link_text = match.group(1)
-        link_path = match.group(2)
+    # リンク先 -> 置換後の文字列（変換しない場合はNone）
+    # 同じリンク先が複数回現れても（リンクテキストが違う場合も含む）解決・読み込みは1回だけ行う
+    replacements = {}
+    converted_count = 0
+    # 基準ディレクトリとVault rootは投稿ごとに1回だけ求める
+    md_dir = os.path.dirname(os.path.abspath(md_file))
+    vault_root = find_obsidian_vault_root(md_file)
 
+    def analyze_link(link_text, link_path):
         # 外部URL、アンカーリンク、画像はスキップ
         if link_path.startswith('http') or link_path.startswith('#') or link_path.startswith('!'):
             return None
@@ -275,20 +453,20 @@ def process_internal_links(config, md_file, text):
         if not link_path.endswith('.md') and not os.path.splitext(link_path)[1] == '':
             return None
 
-        print(f"内部リンク検出: [{link_text}]({link_path})")
+        logger.debug("内部リンク検出: [%s](%s)", link_text, link_path)
 
         # リンク先のMarkdownファイルパスを解決
-        abs_link_path = resolve_markdown_link_path(md_file, link_path)
+        abs_link_path = resolve_markdown_link_path(md_file, link_path, vault_root, md_dir)
 
         if not abs_link_path:
-            print(f"   ⚠️ リンク先ファイルが見つからないためスキップ: {link_path}")
+            logger.warning("   ⚠️ リンク先ファイルが見つからないためスキップ: %s", link_path)
             return None
 
         # リンク先のWordPressリンクデータを取得
         link_data = get_wordpress_link_data_from_md(config, abs_link_path)
 
         if not link_data:
-            print(f"   ⚠️ リンクデータが取得できないためスキップ: {link_path}")
+            logger.warning("   ⚠️ リンクデータが取得できないためスキップ: %s", link_path)
             return None
 
         # Gutenberg内部リンクブロックを生成
@@ -302,25 +480,25 @@ def process_internal_links(config, md_file, text):
 
         gutenberg_link = f'<!-- wp:loos/post-link {{"linkData":{link_data_json},"icon":"link"}} /-->'
 
-        print(f"   ✅ 変換完了: Gutenbergブロック生成")
+        logger.debug("   ✅ 変換完了: Gutenbergブロック生成")
 
-        return {
-            'original': match.group(0),
-            'replacement': gutenberg_link
-        }
+        return gutenberg_link
 
-    # すべてのリンクを解析
-    for match in re.finditer(link_pattern, text):
-        result = analyze_link(match)
-        if result:
-            links_to_replace.append(result)
+    def replace_link(match):
+        nonlocal converted_count
+        link_path = match.group(2)
+        if link_path not in replacements:
+            replacements[link_path] = analyze_link(match.group(1), link_path)
+        replacement = replacements[link_path]
+        if replacement is None:
+            return match.group(0)
+        converted_count += 1
+        return replacement
 
-    # 置換を実行
-    converted_text = text
-    for link in links_to_replace:
-        converted_text = converted_text.replace(link['original'], link['replacement'])
+    # すべてのリンクを1回の走査で解析・置換（マッチした位置だけを置き換える）
+    converted_text = _RE_MD_LINK.sub(replace_link, text)
 
-    print(f"✅ 内部リンク変換処理完了: {len(links_to_replace)}個のリンクを変換")
+    logger.info("✅ 内部リンク変換処理完了: %s個のリンクを変換", converted_count)
     return converted_text
 
 def rename_local_image(original_path, new_filename):
@@ -332,33 +510,40 @@ def rename_local_image(original_path, new_filename):
     if original_path == new_path:
         return new_path
 
-    # リネーム実行
-    if os.path.exists(original_path):
-        # 移行先に既にファイルが存在する場合の対処
-        if os.path.exists(new_path):
-            print(f"   警告: リネーム先ファイルが既に存在: {new_path}")
-            # ハッシュを比較して同じファイルかチェック
-            if get_file_hash(original_path) == get_file_hash(new_path):
-                print(f"   同一ファイルのため元ファイルを削除: {original_path}")
-                os.remove(original_path)
-                return new_path
-            else:
-                print(f"   異なるファイルのためリネームをスキップ: {original_path}")
-                return original_path
-        else:
-            shutil.move(original_path, new_path)
-            print(f"   ✅ ローカル画像リネーム: {os.path.basename(original_path)} -> {new_filename}")
-            return new_path
+    try:
+        original_stat = os.stat(original_path)
+    except FileNotFoundError:
+        return original_path
+
+    try:
+        new_stat = os.stat(new_path)
+    except FileNotFoundError:
+        # リネーム実行（同じディレクトリ内なので os.replace で済む）
+        os.replace(original_path, new_path)
+        logger.info("   ✅ ローカル画像リネーム: %s -> %s", os.path.basename(original_path), new_filename)
+        return new_path
 
+    # 大文字小文字を区別しないファイルシステムやハードリンクで、実体が同じファイルの場合
+    if os.path.samestat(original_stat, new_stat):
+        return new_path
+
+    # 移行先に既にファイルが存在する場合の対処
+    logger.warning("   警告: リネーム先ファイルが既に存在: %s", new_path)
+    # サイズが同じ場合のみハッシュを比較して同じファイルかチェック
+    if original_stat.st_size == new_stat.st_size and get_file_hash(original_path) == get_file_hash(new_path):
+        logger.info("   同一ファイルのため元ファイルを削除: %s", original_path)
+        os.remove(original_path)
+        return new_path
+
+    logger.warning("   異なるファイルのためリネームをスキップ: %s", original_path)
     return original_path
 
 def sanitize_filename(text):
     """ファイル名として安全な文字列に変換（日本語対応）"""
     # ファイル名に使えない文字を削除・置換
-    unsafe_chars = r'[<>:"/\\|?*]'
-    text = re.sub(unsafe_chars, '-', text)
+    text = _RE_UNSAFE_FILENAME_CHARS.sub('-', text)
     # 連続するハイフンを単一に
-    text = re.sub(r'-+', '-', text)
+    text = _RE_HYPHENS.sub('-', text)
     # 前後の空白・ハイフンを削除
     text = text.strip(' -')
     # 空の場合はデフォルト値
@@ -374,46 +559,49 @@ def escape_html(text):
                 .replace('<', '&lt;')
                 .replace('>', '&gt;'))
 
+def escape_attr(value):
+    """HTML属性値（"..." で囲む）に埋め込むため、ダブルクォートをエスケープ"""
+    return value.replace('"', '&quot;')
+
 def process_inline_formatting(text, footnote_counter=None):
     """インライン記法を処理（太字、斜体、リンク、インラインコード、脚注）"""
-    # ショートコードを含む行は処理をスキップ
-    if re.search(r'\[[\w\-_]+[^\]]*\]', text):
+    # 記法の開始文字を含まない行（大半の地の文）は正規表現を使わずにそのまま返す
+    if not ('*' in text or '_' in text or '`' in text or '[' in text):
         return text
 
-    # インラインコード（最初に処理して他の記法との競合を避ける）
-    text = re.sub(r'`([^`]+)`', r'<code>\1</code>', text)
-
-    # 太字
-    text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
-    text = re.sub(r'__(.*?)__', r'<strong>\1</strong>', text)
-
-    # 斜体
-    text = re.sub(r'\*(.*?)\*', r'<em>\1</em>', text)
-    text = re.sub(r'_(.*?)_', r'<em>\1</em>', text)
+    # ショートコードを含む行は処理をスキップ
+    if _RE_SHORTCODE.search(text):
+        return text
 
-    # 脚注参照（footnote_counterが提供されている場合のみ）
-    if footnote_counter is not None:
-        def replace_footnote_ref(match):
-            ref_id = match.group(1)
-            if ref_id in footnote_counter:
+    def replace_inline(match):
+        """1トークンをHTMLに変換（太字・斜体・リンクの中身は再帰的に処理）"""
+        kind = match.lastgroup
+        if kind == 'code':
+            # インラインコードの中身はそのまま出力する
+            return f'<code>{match.group("code")}</code>'
+        if kind == 'fn':
+            # 脚注参照（footnote_counterに登録されている場合のみ）
+            ref_id = match.group('fn')
+            if footnote_counter is not None and ref_id in footnote_counter:
                 uuid_id, num = footnote_counter[ref_id]
                 return f'<sup data-fn="{uuid_id}" class="fn"><a href="#{uuid_id}" id="{uuid_id}-link">{num}</a></sup>'
             return match.group(0)
-
-        text = re.sub(r'\[\^([^\]]+)\]', replace_footnote_ref, text)
-
-    # リンク（脚注参照の後に処理）
-    text = re.sub(r'\[([^\]^]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', text)
-
-    return text
+        if kind == 'lurl':
+            return f'<a href="{escape_attr(match.group("lurl"))}">{_RE_INLINE.sub(replace_inline, match.group("ltext"))}</a>'
+        inner = _RE_INLINE.sub(replace_inline, match.group(kind))
+        if kind in ('bi1', 'bi2'):
+            return f'<strong><em>{inner}</em></strong>'
+        if kind in ('b1', 'b2', 'b3', 'b4', 'b5', 'b6'):
+            return f'<strong>{inner}</strong>'
+        return f'<em>{inner}</em>'
+
+    # インラインコード・太字・斜体・脚注参照・リンクを1回の走査で変換
+    return _RE_INLINE.sub(replace_inline, text)
 
 def convert_urls_to_links(text: str) -> str:
     """
     テキスト内のURLを自動的にHTMLリンクに変換
     """
-    # URLパターン (http:// または https:// で始まる)
-    url_pattern = r'(https?://[^\s]+)'
-
     def replace_url(match):
         url = match.group(1)
         # URLの末尾の句読点を除外
@@ -421,26 +609,34 @@ def convert_urls_to_links(text: str) -> str:
         while url and url[-1] in '.,;:!?)':
             punctuation = url[-1] + punctuation
             url = url[:-1]
-        return f'<a href="{url}">{url}</a>{punctuation}'
+        return f'<a href="{escape_attr(url)}">{url}</a>{punctuation}'
 
-    return re.sub(url_pattern, replace_url, text)
+    return _RE_URL.sub(replace_url, text)
 
-def extract_footnotes(markdown_content: str) -> Tuple[str, Dict[str, str]]:
+def extract_footnotes(markdown_content: str) -> Tuple[str, Dict[str, str], List[str]]:
     """
     Markdownから脚注定義を抽出し、本文から削除
+    
+    同じ走査で本文中の脚注参照も集める
 
     Returns:
-        (本文コンテンツ, {脚注ID: 脚注内容})
+        (本文コンテンツ, {脚注ID: 脚注内容}, 本文中の脚注参照IDのリスト（出現順・重複なし）)
     """
     footnotes = {}
+    # 脚注の定義も参照もない文書（大半の投稿）は行に分割せずそのまま返す
+    if '[^' not in markdown_content:
+        return markdown_content, footnotes, []
+
     lines = markdown_content.split('\n')
     content_lines = []
+    # 脚注参照IDを出現順に記録（dictで重複を除く）
+    ref_ids = {}
 
     i = 0
     while i < len(lines):
         line = lines[i]
         # 脚注定義の検出: [^id]: 内容
-        match = re.match(r'^\[\^([^\]]+)\]:\s*(.+)$', line)
+        match = _RE_FOOTNOTE_DEF.match(line)
         if match:
             footnote_id = match.group(1)
             footnote_text = match.group(2)
@@ -455,9 +651,12 @@ def extract_footnotes(markdown_content: str) -> Tuple[str, Dict[str, str]]:
             continue
 
         content_lines.append(line)
+        if '[^' in line:
+            for ref_id in _RE_FOOTNOTE_REF.findall(line):
+                ref_ids.setdefault(ref_id)
         i += 1
 
-    return '\n'.join(content_lines), footnotes
+    return '\n'.join(content_lines), footnotes, list(ref_ids)
 
 def create_footnotes_block(footnotes: Dict[str, str], footnote_order: Dict[str, Tuple[str, int]]) -> str:
     """
@@ -473,6 +672,25 @@ def create_footnotes_block(footnotes: Dict[str, str], footnote_order: Dict[str,
     # Gutenberg標準の脚注ブロック（wp:footnotesで自動生成される）
     return '<!-- wp:footnotes /-->'
 
+# ブロックごとに作り直さない固定値（言語名の表示用マッピング・定型のブロック属性）
+_LANG_DISPLAY_NAMES = {
+    'python': 'Python',
+    'php': 'PHP',
+    'javascript': 'JavaScript',
+    'js': 'JavaScript',
+    'html': 'HTML',
+    'css': 'CSS',
+    'bash': 'Bash',
+    'shell': 'Shell',
+    'sql': 'SQL',
+    'json': 'JSON',
+    'xml': 'XML',
+    'yaml': 'YAML',
+    'yml': 'YAML'
+}
+_HCB_TEXT_ATTRS = json.dumps({"langType": "text", "langName": "Text"})
+_HEADING_ATTRS = {level: json.dumps({"level": level}) for level in range(1, 7)}
+
 def create_heading_block(content: str, level: int, footnote_counter=None) -> str:
     """見出しブロックを作成"""
     content = process_inline_formatting(content, footnote_counter)
@@ -480,7 +698,7 @@ def create_heading_block(content: str, level: int, footnote_counter=None) -> str
     if level == 2:
         return f'<!-- wp:heading -->\n<h{level} class="wp-block-heading">{content}</h{level}>\n<!-- /wp:heading -->'
     else:
-        attrs = json.dumps({"level": level})
+        attrs = _HEADING_ATTRS[level]
         return f'<!-- wp:heading {attrs} -->\n<h{level} class="wp-block-heading">{content}</h{level}>\n<!-- /wp:heading -->'
 
 def create_paragraph_block(content: str, footnote_counter=None) -> str:
@@ -492,56 +710,37 @@ def create_paragraph_block(content: str, footnote_counter=None) -> str:
 
 def create_image_block(url: str, alt: str = '') -> str:
     """画像ブロックを作成"""
-    return f'<!-- wp:image -->\n<figure class="wp-block-image"><img src="{url}" alt="{alt}"/></figure>\n<!-- /wp:image -->'
+    return f'<!-- wp:image -->\n<figure class="wp-block-image"><img src="{escape_attr(url)}" alt="{escape_attr(alt)}"/></figure>\n<!-- /wp:image -->'
 
 def create_list_block(items: List[str], ordered: bool = False, footnote_counter=None) -> str:
     """リストブロックを作成"""
     tag = "ol" if ordered else "ul"
     attrs = json.dumps({"ordered": ordered}) if ordered else "{}"
 
-    list_html = f'<{tag}>'
+    parts = [f'<{tag}>']
     for item in items:
         processed_item = process_inline_formatting(item, footnote_counter)
-        list_html += f'<li>{processed_item}</li>'
-    list_html += f'</{tag}>'
+        parts.append(f'<li>{processed_item}</li>')
+    parts.append(f'</{tag}>')
+    list_html = ''.join(parts)
 
     return f'<!-- wp:list {attrs} -->\n{list_html}\n<!-- /wp:list -->'
 
 def create_code_block(use_highlight_plugin: bool, code: str, language: str = '') -> str:
     """コードブロックを作成（Highlight Code Block対応）"""
-    print(f"コードブロック作成: 言語={language}, USE_HIGHLIGHT_CODE_BLOCK={use_highlight_plugin}")
+    logger.debug("コードブロック作成: 言語=%s, USE_HIGHLIGHT_CODE_BLOCK=%s", language, use_highlight_plugin)
 
     if use_highlight_plugin:
         # Highlight Code Block プラグイン専用ブロック
         if language:
-            # 言語名のマッピング（表示用）
-            lang_display_names = {
-                'python': 'Python',
-                'php': 'PHP',
-                'javascript': 'JavaScript',
-                'js': 'JavaScript',
-                'html': 'HTML',
-                'css': 'CSS',
-                'bash': 'Bash',
-                'shell': 'Shell',
-                'sql': 'SQL',
-                'json': 'JSON',
-                'xml': 'XML',
-                'yaml': 'YAML',
-                'yml': 'YAML'
-            }
-
-            lang_name = lang_display_names.get(language.lower(), language.capitalize())
+            lang_name = _LANG_DISPLAY_NAMES.get(language.lower(), language.capitalize())
             attrs = json.dumps({
                 "langType": language,
                 "langName": lang_name
             })
         else:
             # 言語指定なしの場合
-            attrs = json.dumps({
-                "langType": "text",
-                "langName": "Text"
-            })
+            attrs = _HCB_TEXT_ATTRS
             language = "text"
 
         # HTMLエスケープしたコード
@@ -551,19 +750,19 @@ def create_code_block(use_highlight_plugin: bool, code: str, language: str = '')
         html_content = f'<div class="hcb_wrap"><pre class="prism undefined-numbers lang-{language}" data-lang="{lang_name if language != "text" else "Text"}"><code>{escaped_code}</code></pre></div>'
 
         result = f'<!-- wp:loos-hcb/code-block {attrs} -->\n{html_content}\n<!-- /wp:loos-hcb/code-block -->'
-        print(f"Highlight Code Block形式で生成")
+        logger.debug("Highlight Code Block形式で生成")
         return result
 
     elif language:
         # WordPress標準コードブロック（言語指定あり）
         attrs = json.dumps({"language": language})
         result = f'<!-- wp:code {attrs} -->\n<pre class="wp-block-code"><code lang="{language}" class="language-{language}">{code}</code></pre>\n<!-- /wp:code -->'
-        print(f"WordPress標準（言語あり）で生成")
+        logger.debug("WordPress標準（言語あり）で生成")
         return result
     else:
         # WordPress標準コードブロック（言語指定なし）
         result = f'<!-- wp:code -->\n<pre class="wp-block-code"><code>{code}</code></pre>\n<!-- /wp:code -->'
-        print(f"WordPress標準（言語なし）で生成")
+        logger.debug("WordPress標準（言語なし）で生成")
         return result
 
 def parse_table(lines: List[str], start_index: int) -> Tuple[List[str], int]:
@@ -594,35 +793,36 @@ def create_table_block(table_lines: List[str], footnote_counter=None) -> str:
     header_line = table_lines[0]
     body_lines = table_lines[2:] if len(table_lines) > 2 else []
 
-    # ヘッダーセルを解析
-    header_cells = [cell.strip() for cell in header_line.split('|') if cell.strip()]
+    # ヘッダーセルを解析（各セルのstripは1回だけ、空のセルは除く）
+    header_cells = [cell for cell in map(str.strip, header_line.split('|')) if cell]
+    header_count = len(header_cells)
 
-    # ボディ行を解析
+    # ボディ行を解析（ヘッダー数を超えるセルはここで切り捨てる）
     body_rows = []
     for line in body_lines:
-        cells = [cell.strip() for cell in line.split('|') if cell.strip()]
+        cells = [cell for cell in map(str.strip, line.split('|')) if cell]
         if cells:  # 空でない行のみ
-            body_rows.append(cells)
+            body_rows.append(cells[:header_count])
 
     # HTMLテーブルを構築（正しいクラス名を使用）
-    table_html = '<table class="has-fixed-layout"><thead><tr>'
+    parts = ['<table class="has-fixed-layout"><thead><tr>']
 
     # ヘッダー
     for cell in header_cells:
         processed_cell = process_inline_formatting(cell, footnote_counter)
-        table_html += f'<th>{processed_cell}</th>'
-    table_html += '</tr></thead><tbody>'
+        parts.append(f'<th>{processed_cell}</th>')
+    parts.append('</tr></thead><tbody>')
 
     # ボディ
     for row in body_rows:
-        table_html += '<tr>'
-        for i, cell in enumerate(row):
-            if i < len(header_cells):  # ヘッダー数と合わせる
-                processed_cell = process_inline_formatting(cell, footnote_counter)
-                table_html += f'<td>{processed_cell}</td>'
-        table_html += '</tr>'
+        parts.append('<tr>')
+        for cell in row:
+            processed_cell = process_inline_formatting(cell, footnote_counter)
+            parts.append(f'<td>{processed_cell}</td>')
+        parts.append('</tr>')
 
-    table_html += '</tbody></table>'
+    parts.append('</tbody></table>')
+    table_html = ''.join(parts)
 
     return f'<!-- wp:table -->\n<figure class="wp-block-table">{table_html}</figure>\n<!-- /wp:table -->'
 
@@ -640,22 +840,22 @@ def parse_list_items(lines: List[str], start_index: int) -> Tuple[List[str], int
 
     # 最初の行でリストタイプを判定
     first_line = lines[i].strip()
-    if re.match(r'^\d+\.', first_line):
+    if _RE_LIST_ORD_START.match(first_line):
         ordered = True
-        pattern = r'^\d+\.\s*(.*)'
+        pattern = _RE_LIST_ORD_ITEM
     else:
-        pattern = r'^[-*+]\s*(.*)'
+        pattern = _RE_LIST_UNORD_ITEM
 
     while i < len(lines):
         line = lines[i].strip()
         if not line:
             # 空行をチェック（リスト終了の可能性）
-            if i + 1 < len(lines) and not re.match(r'^[-*+\d]', lines[i + 1].strip()):
+            if i + 1 < len(lines) and not _RE_LIST_CONTINUE.match(lines[i + 1].strip()):
                 break
             i += 1
             continue
 
-        match = re.match(pattern, line)
+        match = pattern.match(line)
         if match:
             items.append(match.group(1))
         else:
@@ -668,7 +868,7 @@ def parse_list_items(lines: List[str], start_index: int) -> Tuple[List[str], int
 def parse_code_block(lines: List[str], start_index: int) -> Tuple[str, str, int]:
     """コードブロックを解析"""
     start_line = lines[start_index].strip()
-    language_match = re.match(r'^```(\w*)', start_line)
+    language_match = _RE_CODE_FENCE.match(start_line)
     language = language_match.group(1) if language_match and language_match.group(1) else ''
 
     code_lines = []
@@ -683,26 +883,32 @@ def parse_code_block(lines: List[str], start_index: int) -> Tuple[str, str, int]
     code = '\n'.join(code_lines)
     return code, language, i
 
+def _match_line_kind(line: str):
+    """行の種類を判定（ブロックの開始になりえない先頭文字の行は正規表現を使わずにNoneを返す）"""
+    first = line[0]
+    if first in _LINE_KIND_FIRST_CHARS or first.isdecimal():
+        return _RE_LINE_KIND.match(line)
+    return None
+
 def markdown_to_gutenberg(markdown_content: str, use_highlight_plugin: bool) -> Tuple[str, List[Dict]]:
     """MarkdownをGutenbergブロック形式に変換（脚注対応）
 
     Returns:
         (Gutenbergコンテンツ, 脚注メタデータのリスト)
     """
-    print("Markdown → Gutenberg変換開始...")
+    logger.info("Markdown → Gutenberg変換開始...")
 
     # 脚注を抽出
-    content_without_footnotes, footnotes = extract_footnotes(markdown_content)
-    print(f"脚注検出: {len(footnotes)}個")
+    content_without_footnotes, footnotes, ref_ids = extract_footnotes(markdown_content)
+    logger.info("脚注検出: %s個", len(footnotes))
 
     # 脚注の出現順序を記録（UUID, 番号のタプル）
     footnote_order = {}
     footnote_counter_num = 1
 
-    # 本文中の脚注参照を検出して番号とUUIDを割り当て
-    for match in re.finditer(r'\[\^([^\]]+)\]', content_without_footnotes):
-        footnote_id = match.group(1)
-        if footnote_id not in footnote_order and footnote_id in footnotes:
+    # 本文中の脚注参照（抽出時に出現順で収集済み）に番号とUUIDを割り当て
+    for footnote_id in ref_ids:
+        if footnote_id in footnotes:
             # UUIDv4を生成
             footnote_uuid = str(uuid.uuid4())
             footnote_order[footnote_id] = (footnote_uuid, footnote_counter_num)
@@ -721,24 +927,27 @@ def markdown_to_gutenberg(markdown_content: str, use_highlight_plugin: bool) ->
             i += 1
             continue
 
-        # 見出し
-        if stripped.startswith('#'):
-            level = len(stripped) - len(stripped.lstrip('#'))
-            if level <= 6:  # H1-H6のみ
-                content = stripped.lstrip('#').strip()
-                blocks.append(create_heading_block(content, level, footnote_order))
-                i += 1
-                continue
+        # 行の種類を1回のマッチで判定
+        kind_match = _match_line_kind(stripped)
+        kind = kind_match.lastgroup if kind_match else None
+
+        # 見出し（H1-H6のみ）
+        if kind == 'heading':
+            level = len(kind_match.group('heading'))
+            content = stripped.lstrip('#').strip()
+            blocks.append(create_heading_block(content, level, footnote_order))
+            i += 1
+            continue
 
         # コードブロック
-        if stripped.startswith('```'):
+        if kind == 'fence':
             code, language, end_index = parse_code_block(lines, i)
             blocks.append(create_code_block(use_highlight_plugin, code, language))
             i = end_index + 1
             continue
 
         # テーブル
-        if stripped.startswith('|') and stripped.endswith('|'):
+        if kind == 'table':
             table_lines, end_index = parse_table(lines, i)
             if len(table_lines) >= 2:  # ヘッダーとセパレーターが最低限必要
                 blocks.append(create_table_block(table_lines, footnote_order))
@@ -746,14 +955,14 @@ def markdown_to_gutenberg(markdown_content: str, use_highlight_plugin: bool) ->
                 continue
 
         # 引用
-        if stripped.startswith('>'):
+        if kind == 'quote':
             quote_content = stripped.lstrip('>').strip()
             blocks.append(create_quote_block(quote_content, footnote_order))
             i += 1
             continue
 
         # リスト
-        if re.match(r'^[-*+]\s', stripped) or re.match(r'^\d+\.\s', stripped):
+        if kind == 'list':
             items, end_index, ordered = parse_list_items(lines, i)
             if items:
                 blocks.append(create_list_block(items, ordered, footnote_order))
@@ -761,7 +970,7 @@ def markdown_to_gutenberg(markdown_content: str, use_highlight_plugin: bool) ->
             continue
 
         # 画像
-        img_match = re.match(r'!\[([^\]]*)\]\(([^)]*)\)', stripped)
+        img_match = _RE_IMG.match(stripped) if kind == 'image' else None
         if img_match:
             alt_text = img_match.group(1)
             img_url = img_match.group(2)
@@ -770,22 +979,17 @@ def markdown_to_gutenberg(markdown_content: str, use_highlight_plugin: bool) ->
             continue
 
         # 段落（複数行をまとめる）
-        paragraph_lines = []
+        # 先頭行はどの種類にも当てはまらなかった行なので必ず段落に含める
+        paragraph_lines = [stripped]
+        i += 1
         while i < len(lines):
             current_line = lines[i].strip()
 
-            # 段落終了条件をチェック
+            # 段落終了条件をチェック（空行、またはテーブル以外のブロック開始行）
             if not current_line:
                 break
-            if current_line.startswith('#'):
-                break
-            if current_line.startswith('```'):
-                break
-            if current_line.startswith('>'):
-                break
-            if re.match(r'^[-*+]\s', current_line) or re.match(r'^\d+\.\s', current_line):
-                break
-            if re.match(r'!\[.*\]\(.*\)', current_line):
+            kind_match = _match_line_kind(current_line)
+            if kind_match and kind_match.lastgroup != 'table':
                 break
 
             paragraph_lines.append(current_line)
@@ -814,43 +1018,94 @@ def markdown_to_gutenberg(markdown_content: str, use_highlight_plugin: bool) ->
                     'content': footnote_content
                 }
                 footnotes_meta.append(footnote_data)
-                print(f"   脚注 [{num}]: UUID={footnote_uuid}, 内容={footnote_content[:80]}...")
+                logger.debug("   脚注 [%s]: UUID=%s, 内容=%s...", num, footnote_uuid, footnote_content[:80])
 
-        print(f"✅ 脚注ブロック追加: {len(footnote_order)}個の脚注")
-        print(f"✅ 脚注メタデータ生成: {len(footnotes_meta)}個")
+        logger.info("✅ 脚注ブロック追加: %s個の脚注", len(footnote_order))
+        logger.info("✅ 脚注メタデータ生成: %s個", len(footnotes_meta))
 
     result = '\n\n'.join(blocks)
-    print(f"✅ Gutenberg変換完了: {len(blocks)}個のブロックを生成")
+    logger.info("✅ Gutenberg変換完了: %s個のブロックを生成", len(blocks))
     return result, footnotes_meta
 
-def process_images_with_local_rename(config, md_file, slug):
+def replace_image_links(text, *link_maps):
+    """
+    画像リンクのリンク先を1回の走査でまとめて置換
+    
+    Args:
+        text: 置換対象のテキスト
+        *link_maps: (alt, 元のパス) -> 新しいパス の辞書（出力ごとに1つ）
+        
+    Returns:
+        tuple: 辞書ごとの置換結果（辞書と同じ順）
+    """
+    outputs = [[] for _ in link_maps]
+    pos = 0
+    for match in _RE_IMG.finditer(text):
+        key = (match.group(1), match.group(2))
+        start, end = match.span()
+        for links, parts in zip(link_maps, outputs):
+            parts.append(text[pos:start])
+            new_path = links.get(key)
+            parts.append(match.group(0) if new_path is None else f"![{key[0]}]({new_path})")
+        pos = end
+    return tuple(''.join(parts) + text[pos:] for parts in outputs)
+
+def process_images_with_local_rename(config, md_file, slug, text, fm):
     """
     ローカル画像をリネームし、Markdownファイル内のリンクも更新
     その後WordPress用コンテンツを生成
+    
+    fm の wp_images はその場で更新する。Markdownファイルへの書き込みは
+    リンクや wp_images に変更があった場合のみ行う
+    
+    Returns:
+        (WordPress用コンテンツ, 書き込み後のMarkdownファイル全体の内容)
     """
-    with open(md_file, encoding="utf-8") as f:
-        text = f.read()
-
-    fm = parse_frontmatter(md_file)
     image_map = fm.get('wp_images', {})
+    fm_changed = 'wp_images' not in fm
 
-    images = re.findall(r'!\[([^\]]*)\]\(([^)]*)\)', text)  # alt text も取得
-    wp_text = text
-    local_text = text
+    images = _RE_IMG.findall(text)  # alt text も取得
     image_counter = 1
 
     # ファイル名として安全なslugを生成
     safe_slug = sanitize_filename(slug)
 
+    # 新しいローカルパスの基準ディレクトリ（全画像で共通）
+    md_dir = os.path.dirname(os.path.abspath(md_file))
+    vault_root = find_obsidian_vault_root(md_file)
+
+    # ローカルのリネームは順番に行う（連番を決定的にするため）
+    renamed_images = []
+    # (alt, 元のパス) -> 新しいリンク先（同じリンクが複数回現れる場合は最初の結果を使う）
+    local_links = {}
+    wp_links = {}
+    # 元のパス -> (新しい絶対パス, 新しいローカルパス)
+    # 同じ画像が複数回（altが違う場合も含む）参照されていても解決・リネーム・ハッシュ計算は1回だけ行う
+    resolved_paths = {}
+    # 画像ファイルの絶対パス（リネーム前・後） -> (新しい絶対パス, 新しいローカルパス)
+    # 表記の違うリンク（./a.png と a.png など）が同じファイルを指す場合に、後のリネームで
+    # 先に解決したファイルを移動しないようにする
+    resolved_files = {}
     for alt_text, img_path in images:
+        resolved = resolved_paths.get(img_path)
+        if resolved is not None:
+            local_links.setdefault((alt_text, img_path), resolved[1])
+            renamed_images.append((alt_text, img_path, *resolved))
+            continue
+
         # URLデコード
         decoded_img_path = unquote(img_path)
-        print(f"画像処理開始: {decoded_img_path}")
+        logger.info("画像処理開始: %s", decoded_img_path)
 
         # Obsidian形式の画像パスを解決
-        abs_path = resolve_image_path(md_file, decoded_img_path)
-
-        if abs_path:
+        abs_path = resolve_image_path(md_file, decoded_img_path, vault_root, md_dir)
+
+        resolved = resolved_files.get(abs_path) if abs_path else None
+        if resolved is not None:
+            resolved_paths[img_path] = resolved
+            local_links.setdefault((alt_text, img_path), resolved[1])
+            renamed_images.append((alt_text, img_path, *resolved))
+        elif abs_path:
             # 新しいローカルファイル名を生成
             ext = os.path.splitext(abs_path)[1]
             new_local_filename = f"{safe_slug}-{image_counter:02d}{ext}"
@@ -859,168 +1114,226 @@ def process_images_with_local_rename(config, md_file, slug):
             new_abs_path = rename_local_image(abs_path, new_local_filename)
 
             # 新しいローカルパスを計算（Markdownファイルからの相対パス）
-            md_dir = os.path.dirname(os.path.abspath(md_file))
-            vault_root = find_obsidian_vault_root(md_file)
-
             if vault_root and new_abs_path.startswith(vault_root):
                 new_local_path = os.path.relpath(new_abs_path, vault_root)
             else:
                 new_local_path = os.path.relpath(new_abs_path, md_dir)
 
-            # Markdown内リンク更新
-            old_link = f"![{alt_text}]({img_path})"
-            new_link = f"![{alt_text}]({new_local_path})"
-            local_text = local_text.replace(old_link, new_link)
-            print(f"   ローカルリンク更新: {img_path} -> {new_local_path}")
-
-            # WordPress用処理
-            file_hash = get_file_hash(new_abs_path)
-
-            if file_hash in image_map:
-                # 既存画像を使用
-                wp_info = image_map[file_hash]
-                wp_url = wp_info['url']
-                print(f"   既存画像使用: {wp_url}")
-                # original_path を最新に更新
-                image_map[file_hash]['original_path'] = new_local_path
-            else:
-                # 新規アップロード
-                media_id, wp_url = upload_new_image(config, new_abs_path, safe_slug, file_hash)
+            # Markdown内リンク更新（置換は最後に1回の走査でまとめて行う）
+            local_links.setdefault((alt_text, img_path), new_local_path)
+            logger.debug("   ローカルリンク更新: %s -> %s", img_path, new_local_path)
+
+            resolved = (new_abs_path, new_local_path)
+            resolved_paths[img_path] = resolved_files[abs_path] = resolved_files[new_abs_path] = resolved
+            renamed_images.append((alt_text, img_path, new_abs_path, new_local_path))
+
+            image_counter += 1
+        else:
+            logger.error("   ❌ 画像ファイルが見つかりません: %s", decoded_img_path)
+
+    # リネーム後の画像のハッシュを並列に計算（hashlib はハッシュ計算中にGILを解放する）
+    # 大文字小文字の違いなど上で同じファイルと判定できない別名が後からリネームされた場合でも、
+    # デプロイ全体を止めずに、見つからない画像と同様に扱う
+    hash_paths = []
+    for new_abs_path in dict.fromkeys(new_abs_path for new_abs_path, _ in resolved_paths.values()):
+        if os.path.isfile(new_abs_path):
+            hash_paths.append(new_abs_path)
+        else:
+            logger.error("   ❌ リネーム後に画像ファイルが見つかりません: %s", new_abs_path)
+    if len(hash_paths) > 1:
+        with ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, len(hash_paths))) as executor:
+            file_hashes = dict(zip(hash_paths, executor.map(get_file_hash, hash_paths)))
+    else:
+        file_hashes = {path: get_file_hash(path) for path in hash_paths}
+    resolved_images = [
+        (alt_text, img_path, new_abs_path, new_local_path, file_hashes[new_abs_path])
+        for alt_text, img_path, new_abs_path, new_local_path in renamed_images
+        if new_abs_path in file_hashes
+    ]
+
+    # 未アップロードの画像（同じ内容の画像は1回だけ）を並列アップロード
+    pending_uploads = {}
+    for _, _, new_abs_path, new_local_path, file_hash in resolved_images:
+        if file_hash not in image_map and file_hash not in pending_uploads:
+            pending_uploads[file_hash] = (new_abs_path, new_local_path)
+
+    if pending_uploads:
+        max_workers = min(config.upload_concurrency, len(pending_uploads))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                file_hash: executor.submit(upload_new_image, config, new_abs_path, safe_slug, file_hash)
+                for file_hash, (new_abs_path, _) in pending_uploads.items()
+            }
+            # image_map はメインスレッドでのみ更新する
+            for file_hash, future in futures.items():
+                media_id, wp_url = future.result()
                 image_map[file_hash] = {
                     'id': media_id,
                     'url': wp_url,
-                    'original_path': new_local_path
+                    'original_path': pending_uploads[file_hash][1]
                 }
-                print(f"   新規アップロード: ID {media_id}")
+                logger.info("   新規アップロード: ID %s", media_id)
+        fm_changed = True
 
-            # WordPress投稿用テキスト更新
-            wp_link = f"![{alt_text}]({wp_url})"
-            wp_text = wp_text.replace(old_link, wp_link)
+    for alt_text, img_path, _, new_local_path, file_hash in resolved_images:
+        wp_url = image_map[file_hash]['url']
+        if file_hash not in pending_uploads:
+            logger.info("   既存画像使用: %s", wp_url)
+        # original_path を最新に更新
+        if image_map[file_hash].get('original_path') != new_local_path:
+            image_map[file_hash]['original_path'] = new_local_path
+            fm_changed = True
 
-            image_counter += 1
-        else:
-            print(f"   ❌ 画像ファイルが見つかりません: {decoded_img_path}")
+        # WordPress投稿用テキスト更新
+        wp_links.setdefault((alt_text, img_path), wp_url)
+
+    # WordPress用・ローカル用のテキストを1回の走査で同時に生成
+    wp_text, local_text = replace_image_links(text, wp_links, local_links)
 
     # フロントマターに必ず image_map を反映
     fm['wp_images'] = image_map
 
-    # Markdown更新
-    if local_text != text:
-        content_only = re.sub(r'^---.*?---\n', '', local_text, flags=re.DOTALL)
-        new_fm = yaml.dump(fm, allow_unicode=True, sort_keys=False)
-        updated_md = f"---\n{new_fm}---\n{content_only}"
-
-        with open(md_file, "w", encoding="utf-8") as f:
-            f.write(updated_md)
-        print(f"✅ ローカルMarkdownファイル更新完了（画像リンク更新）")
+    # Markdown更新（リンク更新後の本文とフロントマターを1回で書き込む）
+    if local_text != text or fm_changed:
+        updated_md = write_frontmatter(md_file, fm, local_text, original=text)
+        if local_text != text:
+            logger.info("✅ ローカルMarkdownファイル更新完了（画像リンク更新）")
     else:
-        write_frontmatter(md_file, fm)
+        updated_md = text
 
-    return wp_text
+    return wp_text, updated_md
 
-def process_featured_image_with_hash_tracking(config, md_file, slug, featured_image_path):
-    """アイキャッチ画像をハッシュベースで処理（Obsidian対応）+ ローカルリネーム"""
+def process_featured_image_with_hash_tracking(config, md_file, slug, featured_image_path, fm):
+    """
+    アイキャッチ画像をハッシュベースで処理（Obsidian対応）+ ローカルリネーム
+    
+    fm の wp_images はその場で更新する（ファイルへの書き込みは呼び出し側で行う）
+    
+    Returns:
+        (アイキャッチ画像ID, 新しいローカルパス, wp_images を変更したか)
+    """
     if not featured_image_path or featured_image_path.startswith('http'):
-        print(f"アイキャッチ画像: 指定なしまたはURL形式のためスキップ: {featured_image_path}")
-        return "", ""
+        logger.info("アイキャッチ画像: 指定なしまたはURL形式のためスキップ: %s", featured_image_path)
+        return "", "", False
 
-    print(f"アイキャッチ画像処理開始: {featured_image_path}")
+    logger.info("アイキャッチ画像処理開始: %s", featured_image_path)
 
-    fm = parse_frontmatter(md_file)
     image_map = fm.get('wp_images', {})
 
     decoded_path = unquote(featured_image_path)
-    abs_thumb = resolve_image_path(md_file, decoded_path)
+    md_dir = os.path.dirname(os.path.abspath(md_file))
+    vault_root = find_obsidian_vault_root(md_file)
+    abs_thumb = resolve_image_path(md_file, decoded_path, vault_root, md_dir)
     if not abs_thumb:
-        print(f"❌ アイキャッチ画像画像が見つかりません: {featured_image_path}")
-        return "", ""
+        logger.error("❌ アイキャッチ画像画像が見つかりません: %s", featured_image_path)
+        return "", "", False
 
     safe_slug = sanitize_filename(slug)
     ext = os.path.splitext(abs_thumb)[1]
     new_filename = f"{safe_slug}-featured-image{ext}"
     new_abs_thumb = rename_local_image(abs_thumb, new_filename)
 
-    md_dir = os.path.dirname(os.path.abspath(md_file))
-    vault_root = find_obsidian_vault_root(md_file)
     if vault_root and new_abs_thumb.startswith(vault_root):
         new_featured_image_path = os.path.relpath(new_abs_thumb, vault_root)
     else:
         new_featured_image_path = os.path.relpath(new_abs_thumb, md_dir)
 
-    print(f"   ローカルアイキャッチ画像リネーム: {featured_image_path} -> {new_featured_image_path}")
+    logger.info("   ローカルアイキャッチ画像リネーム: %s -> %s", featured_image_path, new_featured_image_path)
 
     # リネーム後のファイルでハッシュ計算
     file_hash = get_file_hash(new_abs_thumb)
-    print(f"   ハッシュ値: {file_hash}")
+    logger.debug("   ハッシュ値: %s", file_hash)
 
     if file_hash in image_map and 'id' in image_map[file_hash]:
         # 既存アイキャッチ画像使用
         featured_image_id = image_map[file_hash]['id']
-        print(f"✅ 既存アイキャッチ画像使用: ID {featured_image_id}")
+        logger.info("✅ 既存アイキャッチ画像使用: ID %s", featured_image_id)
         # original_path を最新に更新
+        fm_changed = image_map[file_hash].get('original_path') != new_featured_image_path
         image_map[file_hash]['original_path'] = new_featured_image_path
     else:
         # 新規アップロード
-        print(f"📤 新規アイキャッチ画像アップロード開始...")
+        logger.info("📤 新規アイキャッチ画像アップロード開始...")
         featured_image_id, wp_url = upload_new_image(config, new_abs_thumb, safe_slug, file_hash)
         image_map[file_hash] = {
             'id': featured_image_id,
             'url': wp_url,
             'original_path': new_featured_image_path
         }
-        print(f"✅ 新規アイキャッチ画像アップロード完了: ID {featured_image_id}")
-        print(f"   WordPress URL: {wp_url}")
+        fm_changed = True
+        logger.info("✅ 新規アイキャッチ画像アップロード完了: ID %s", featured_image_id)
+        logger.debug("   WordPress URL: %s", wp_url)
 
     # フロントマターに必ず反映
-    fm['wp_images'] = image_map
-
-    write_frontmatter(md_file, fm)
+    if 'wp_images' not in fm:
+        fm['wp_images'] = image_map
+        fm_changed = True
 
-    return featured_image_id, new_featured_image_path
+    return featured_image_id, new_featured_image_path, fm_changed
 
 def assign_images_to_post(config, wp_id, image_map):
-    """既存の画像を投稿に割り当て"""
-    for file_hash, img_info in image_map.items():
-        if 'id' in img_info:
-            media_id = img_info['id']
-            # 現在のpost_parentを確認
-            check_cmd = f"cd {config.wp_path} && {config.wp_cli} db query \"SELECT post_parent FROM wp_posts WHERE ID={media_id}\" --skip-column-names"
-            current_parent = subprocess.check_output(ssh_cmd(config, check_cmd), text=True).strip()
-
-            if current_parent != str(wp_id):
-                # 投稿に割り当てられていない場合のみ更新
-                update_cmd = f"cd {config.wp_path} && {config.wp_cli} db query \"UPDATE wp_posts SET post_parent={wp_id} WHERE ID={media_id}\""
-                subprocess.run(ssh_cmd(config, update_cmd), check=True)
-                print(f"   ✅ 画像ID {media_id} を投稿ID {wp_id} に割り当て")
-            else:
-                print(f"   既に割り当て済み: 画像ID {media_id} → 投稿ID {wp_id}")
+    """既存の画像を投稿に割り当て（1回のSSH・1つのUPDATEでまとめて更新）"""
+    # SQLに埋め込むため、数値のIDのみを対象にする
+    media_ids = list(dict.fromkeys(
+        str(img_info['id']) for img_info in image_map.values()
+        if 'id' in img_info and str(img_info['id']).isdigit()
+    ))
+    if not media_ids:
+        return
+
+    # 投稿に割り当てられていない画像のみ更新し、更新件数を返す
+    ids = ",".join(media_ids)
+    update_cmd = (
+        f"cd {config.wp_path} && {config.wp_cli} db query "
+        f"\"UPDATE wp_posts SET post_parent={int(wp_id)} WHERE ID IN ({ids}) "
+        f"AND (post_parent<>{int(wp_id)} OR post_parent IS NULL); SELECT ROW_COUNT();\" --skip-column-names"
+    )
+    updated = subprocess.check_output(ssh_cmd(config, update_cmd), text=True).strip()
+    if updated.isdigit():
+        logger.info("   ✅ 画像 %s/%s 件を投稿ID %s に割り当て", updated, len(media_ids), wp_id)
+    else:
+        logger.info("   ✅ 画像 %s 件の投稿ID %s への割り当てを確認", len(media_ids), wp_id)
 
 def main(md_file):
     # 設定を取得
     config = get_config()
 
     base = os.path.splitext(os.path.basename(md_file))[0]
-    fm = parse_frontmatter(md_file)
+    # Markdownファイルは最初に1回だけ読み込み、以降は内容を受け渡す
+    text, fm = load_md(md_file)
 
     if fm.get("private") == True:
-        print(f"公開禁止ファイルのため、処理を終了します。")
-        print(f"  private: true -> 公開不可")
+        logger.info("公開禁止ファイルのため、処理を終了します。")
+        logger.info("  private: true -> 公開不可")
         return
 
     if fm.get("private") == None:
-        print(f"公開可否が設定されていないため、処理を終了します。")
-        print(f"front-matterに 「private」 を設定してください。")
-        print(f"  private: false -> 公開可能")
-        print(f"  private: true  -> 公開不可")
+        logger.info("公開可否が設定されていないため、処理を終了します。")
+        logger.info("front-matterに 「private」 を設定してください。")
+        logger.info("  private: false -> 公開可能")
+        logger.info("  private: true  -> 公開不可")
         return
 
+    # コントロールソケットは実行ごとの専用ディレクトリ（他ユーザー・他の実行と共有しない）に置き、
+    # 以降のsshはすべてこのマスター接続を再利用する
+    control_dir = tempfile.mkdtemp(prefix="md2wp-")
+    config = dataclasses.replace(config, ssh_control_path=os.path.join(control_dir, "ctl"))
+    try:
+        open_ssh_master(config)
+        publish_post(config, md_file, base, text, fm)
+    finally:
+        close_ssh_master(config)
+        shutil.rmtree(control_dir, ignore_errors=True)
+
+def publish_post(config, md_file, base, text, fm):
+    """画像・内部リンクを処理し、WordPressに投稿を作成または更新"""
     wp_id = fm.get("wp_id")
     # フロントマターのtitleを優先、なければファイル名ベースを使用
     title = fm.get("title", base)
     slug = fm.get("slug", base)
 
-    print(f"投稿タイトル: {title}")
-    print(f"投稿スラッグ: {slug}")
+    logger.info("投稿タイトル: %s", title)
+    logger.info("投稿スラッグ: %s", slug)
 
     # tags と categories を安全に処理
     tags_raw = fm.get("tags", [])
@@ -1041,152 +1354,145 @@ def main(md_file):
     featured_image = fm.get("featured_image")
 
     # 本文画像処理（ローカルリネーム + ハッシュベース、WordPress URL変換版コンテンツを生成）
-    wp_content = process_images_with_local_rename(config, md_file, slug)
+    wp_content, text = process_images_with_local_rename(config, md_file, slug, text, fm)
+
+    # 全角のダブルクォート “ ” を ASCII の " に統一
+    # （内部リンクブロックのJSONに含まれるリンク先タイトルを壊さないよう、内部リンク変換の前に行う）
+    wp_content = wp_content.replace("\u201c", '"').replace("\u201d", '"')
 
     # 内部リンク変換処理を追加
     wp_content = process_internal_links(config, md_file, wp_content)
 
-    # 全角のダブルクォート " " を ASCII の " に統一
-    wp_content = wp_content.replace(""", "\"").replace(""", "\"")
-
     # アイキャッチ画像処理（ハッシュベース + ローカルリネーム）
-    featured_image_id, new_featured_image_path = process_featured_image_with_hash_tracking(config, md_file, slug, featured_image)
-
-    # wp-imagesが更新されたあとで、再度取得する
-    fm = parse_frontmatter(md_file)
+    featured_image_id, new_featured_image_path, fm_dirty = process_featured_image_with_hash_tracking(config, md_file, slug, featured_image, fm)
 
     # アイキャッチ画像のフロントマター更新処理
     featured_image_updated = False
     if new_featured_image_path and new_featured_image_path != featured_image:
-        print(f"アイキャッチ画像パス更新: {featured_image} -> {new_featured_image_path}")
+        logger.info("アイキャッチ画像パス更新: %s -> %s", featured_image, new_featured_image_path)
         fm["featured_image"] = new_featured_image_path
         featured_image_updated = True
+        fm_dirty = True
 
-    # ローカルMarkdownファイル更新（アイキャッチ画像パス変更も含む）
-    if featured_image_updated:
-        write_frontmatter(md_file, fm)
-        print(f"✅ フロントマター更新完了（アイキャッチ画像パス変更）")
+    # ローカルMarkdownファイル更新（wp_images とアイキャッチ画像パスの変更がある場合のみまとめて書き込む）
+    # 新規アップロードしたアイキャッチ画像IDは投稿作成の前に記録しておく（投稿作成に失敗しても再アップロードしないため）
+    if fm_dirty:
+        text = write_frontmatter(md_file, fm, text)
+        if featured_image_updated:
+            logger.info("✅ フロントマター更新完了（アイキャッチ画像パス変更）")
 
     # アイキャッチ設定用のオプション作成
     if featured_image_id:
-        featured_image_opt = f"--featured_image={featured_image_id}"
-        print(f"アイキャッチ設定: ID {featured_image_id}")
+        featured_image_opt = f"--featured_image={shlex.quote(str(featured_image_id))}"
+        logger.info("アイキャッチ設定: ID %s", featured_image_id)
     else:
         featured_image_opt = ""
-        print("アイキャッチ: 設定されません")
+        logger.info("アイキャッチ: 設定されません")
 
     # フロントマターを除いたMarkdownコンテンツを取得
-    content_only = re.sub(r'^---.*?---\n', '', wp_content, flags=re.DOTALL)
+    content_only = _strip_frontmatter(wp_content)
 
     # MarkdownをGutenbergブロック形式に変換（脚注対応）
     gutenberg_content, footnotes_meta = markdown_to_gutenberg(content_only, config.use_highlight_code_block)
 
-    # 一時的なGutenbergファイル作成
-    gutenberg_file = f"{base}_gutenberg.txt"
-    with open(gutenberg_file, "w", encoding="utf-8") as f:
-        f.write(gutenberg_content)
-
-    print(f"✅ Gutenbergブロック変換完了: {gutenberg_file}")
+    logger.info("✅ Gutenbergブロック変換完了")
 
-    # サーバにGutenbergコンテンツをアップロード
-    subprocess.run(scp_cmd(config, gutenberg_file, gutenberg_file), check=True)
+    # リモートのコマンドに埋め込む投稿データはすべてクォートする
+    q_title = shlex.quote(str(title))
+    q_slug = shlex.quote(str(slug))
+    q_tags = shlex.quote(tags)
+    q_categories = shlex.quote(categories)
 
-    # 投稿作成 or 更新
+    # 投稿作成 or 更新（本文・アイキャッチ・脚注メタデータを1回のSSHでまとめて実行）
     if not wp_id:
         # 新規投稿（titleを確実に使用）
+        # Gutenbergコンテンツは標準入力から直接渡す（"-"）ため、サーバに一時ファイルは作らない
+        # 投稿IDは作成直後に出力し、後続のメタデータ設定が失敗しても取得できるようにする
         cmd = (
-            f"mkdir -p {config.wp_path}/{config.tmp_dir} && cd {config.wp_path}/{config.tmp_dir} && "
-            f"{config.wp_cli} post create {gutenberg_file} --post_type=post "
-            f"--post_status={config.post_status} --post_title='{title}' --post_name='{slug}' "
-            f"--tags_input='{tags}' --post_category='{categories}' {featured_image_opt} --porcelain && "
-            f"rm {gutenberg_file}"
+            f"cd {config.wp_path} && "
+            f"post_id=$({config.wp_cli} post create - --post_type=post "
+            f"--post_status={config.post_status} --post_title={q_title} --post_name={q_slug} "
+            f"--tags_input={q_tags} --post_category={q_categories} {featured_image_opt} --porcelain) && "
+            f"echo \"$post_id\""
         )
-        new_id = subprocess.check_output(ssh_cmd(config, cmd), text=True).strip()
-        fm["wp_id"] = int(new_id)
-
-        # 画像の未割り当てを解消
-        assign_images_to_post(config, new_id, fm.get('wp_images', {}))
-
-        write_frontmatter(md_file, fm)
-        print(f"✅ 新規投稿ID {new_id} を {md_file} に追記しました")
-        print(f"✅ 投稿タイトル: '{title}' で作成されました")
 
         # アイキャッチ設定（もしあれば）
         if featured_image_id:
-            set_thumb_cmd = (
-                f"cd {config.wp_path} && {config.wp_cli} post meta set {new_id} _featured_image_id {featured_image_id}"
-            )
-            subprocess.run(ssh_cmd(config, set_thumb_cmd), check=True)
-            print(f"✅ 新規投稿 {new_id} にアイキャッチ(ID {featured_image_id}) を設定しました")
+            cmd += f" && {config.wp_cli} post meta set \"$post_id\" _featured_image_id {shlex.quote(str(featured_image_id))}"
 
         # 脚注メタデータを保存
         if footnotes_meta:
-            footnotes_json = json.dumps(footnotes_meta, ensure_ascii=False)
-            print(f"   保存する脚注JSON: {footnotes_json}")
+            footnotes_json = json.dumps(footnotes_meta, ensure_ascii=False, separators=(',', ':'))
+            logger.debug("   保存する脚注JSON: %s", footnotes_json)
 
-            # ダブルクォートをエスケープ
-            footnotes_json_escaped = footnotes_json.replace('\\', '\\\\').replace('"', '\\"')
+            cmd += f" && {config.wp_cli} post meta set \"$post_id\" footnotes {shlex.quote(footnotes_json)}"
 
-            set_footnotes_cmd = (
-                f"cd {config.wp_path} && {config.wp_cli} post meta set {new_id} footnotes \"{footnotes_json_escaped}\""
-            )
-            result = subprocess.run(ssh_cmd(config, set_footnotes_cmd), capture_output=True, text=True, check=True)
-            print(f"✅ 新規投稿 {new_id} に脚注メタデータを保存しました（{len(footnotes_meta)}個）")
+        result = subprocess.run(ssh_cmd(config, cmd), input=gutenberg_content, stdout=subprocess.PIPE, encoding="utf-8")
+        new_id = result.stdout.strip().partition('\n')[0]
+        if not new_id.isdigit():
+            raise subprocess.CalledProcessError(result.returncode or 1, result.args, result.stdout)
+        fm["wp_id"] = int(new_id)
 
-    else:
-        # 既存投稿更新（タイトルも更新）
-        # 本文、タイトル、タグ・カテゴリを更新
-        cmd_update = (
-            f"mkdir -p {config.wp_path}/{config.tmp_dir} && cd {config.wp_path}/{config.tmp_dir} && "
-            f"{config.wp_cli} post update {wp_id} {gutenberg_file} "
-            f"--post_title='{title}' --tags_input='{tags}' --post_category='{categories}' && "
-            f"rm {gutenberg_file}"
-        )
+        # 投稿IDは後続の処理が失敗しても必ず記録する（再実行時に二重投稿しないため）
+        write_frontmatter(md_file, fm, text)
+        logger.info("✅ 新規投稿ID %s を %s に追記しました", new_id, md_file)
+        logger.info("✅ 投稿タイトル: '%s' で作成されました", title)
+        result.check_returncode()
 
-        # アイキャッチ（アイキャッチ画像）を別途設定
-        cmd_thumb = ""
         if featured_image_id:
-            cmd_thumb = f"{config.wp_cli} post meta set {wp_id} _featured_image_id {featured_image_id}"
-
-        # まとめて実行
-        cmd = cmd_update
-        if cmd_thumb:
-            cmd += f" && {cmd_thumb}"
-        subprocess.run(ssh_cmd(config, cmd), check=True)
+            logger.info("✅ 新規投稿 %s にアイキャッチ(ID %s) を設定しました", new_id, featured_image_id)
+        if footnotes_meta:
+            logger.info("✅ 新規投稿 %s に脚注メタデータを保存しました（%s個）", new_id, len(footnotes_meta))
 
         # 画像の未割り当てを解消
-        assign_images_to_post(config, wp_id, fm.get('wp_images', {}))
+        assign_images_to_post(config, new_id, fm.get('wp_images', {}))
 
-        print(f"✅ 投稿ID {wp_id} を更新しました")
-        print(f"✅ 投稿タイトル: '{title}' に更新されました")
+    else:
+        # 既存投稿更新（タイトルも更新）
+        # 本文（標準入力から直接渡す）、タイトル、タグ・カテゴリを更新
+        cmd = (
+            f"cd {config.wp_path} && "
+            f"{config.wp_cli} post update {shlex.quote(str(wp_id))} - "
+            f"--post_title={q_title} --tags_input={q_tags} --post_category={q_categories}"
+        )
+
+        # アイキャッチ（アイキャッチ画像）を設定
+        if featured_image_id:
+            cmd += f" && {config.wp_cli} post meta set {shlex.quote(str(wp_id))} _featured_image_id {shlex.quote(str(featured_image_id))}"
 
         # 脚注メタデータを更新
         if footnotes_meta:
-            footnotes_json = json.dumps(footnotes_meta, ensure_ascii=False)
-            print(f"   更新する脚注JSON: {footnotes_json}")
+            footnotes_json = json.dumps(footnotes_meta, ensure_ascii=False, separators=(',', ':'))
+            logger.debug("   更新する脚注JSON: %s", footnotes_json)
 
-            # ダブルクォートをエスケープ
-            footnotes_json_escaped = footnotes_json.replace('\\', '\\\\').replace('"', '\\"')
+            cmd += f" && {config.wp_cli} post meta update {shlex.quote(str(wp_id))} footnotes {shlex.quote(footnotes_json)}"
+        else:
+            # 脚注がない場合はメタデータを削除（メタデータが存在しない場合のエラーは無視）
+            cmd += f" && {{ {config.wp_cli} post meta delete {shlex.quote(str(wp_id))} footnotes || true; }}"
 
-            update_footnotes_cmd = (
-                f"cd {config.wp_path} && {config.wp_cli} post meta update {wp_id} footnotes \"{footnotes_json_escaped}\""
-            )
-            result = subprocess.run(ssh_cmd(config, update_footnotes_cmd), capture_output=True, text=True, check=True)
-            print(f"✅ 投稿 {wp_id} の脚注メタデータを更新しました（{len(footnotes_meta)}個）")
+        # まとめて実行
+        subprocess.run(ssh_cmd(config, cmd), input=gutenberg_content, encoding="utf-8", check=True)
+
+        logger.info("✅ 投稿ID %s を更新しました", wp_id)
+        logger.info("✅ 投稿タイトル: '%s' に更新されました", title)
+        if footnotes_meta:
+            logger.info("✅ 投稿 %s の脚注メタデータを更新しました（%s個）", wp_id, len(footnotes_meta))
         else:
-            # 脚注がない場合はメタデータを削除
-            delete_footnotes_cmd = (
-                f"cd {config.wp_path} && {config.wp_cli} post meta delete {wp_id} footnotes"
-            )
-            # エラーを無視（メタデータが存在しない場合）
-            subprocess.run(ssh_cmd(config, delete_footnotes_cmd), check=False)
-            print(f"✅ 投稿 {wp_id} の脚注メタデータを削除しました（脚注なし）")
+            logger.info("✅ 投稿 %s の脚注メタデータを削除しました（脚注なし）", wp_id)
 
-    # ローカルGutenbergファイルを削除
-    os.remove(gutenberg_file)
-    print(f"✅ 一時ファイル削除: {gutenberg_file}")
+        # 画像の未割り当てを解消
+        assign_images_to_post(config, wp_id, fm.get('wp_images', {}))
 
 if __name__ == "__main__":
+    # 詳細ログは LOGLEVEL=DEBUG で表示する（不明なレベル名の場合はINFOで続行する）
+    log_level_name = (os.environ.get("LOGLEVEL") or "INFO").upper()
+    log_level = getattr(logging, log_level_name, None)
+    log_level_valid = isinstance(log_level, int)
+    logging.basicConfig(level=log_level if log_level_valid else logging.INFO,
+                        format="%(message)s", stream=sys.stdout)
+    if not log_level_valid:
+        logger.warning("⚠️ 不明なLOGLEVELのためINFOで出力します: %s", log_level_name)
+
     if len(sys.argv) < 2:
         print("Usage: deploy.py file.md")
         sys.exit(1)
@@ -1194,5 +1500,5 @@ if __name__ == "__main__":
     try:
         main(sys.argv[1])
     except Exception as e:
-        print(f"❌ エラーが発生しました: {e}")
+        logger.error("❌ エラーが発生しました: %s", e)
         sys.exit(1)
\ No newline at end of file